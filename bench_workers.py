@@ -0,0 +1,98 @@
+"""Бенчмарк пропускной способности бота в зависимости от числа обработчиков.
+
+Запросы к TheMealDB заменяются заглушкой с фиксированной задержкой, Telegram
+не используется. Обновления проходят через PerUserUpdateProcessor так же, как
+в работающем боте.
+
+Запуск: python bench_workers.py [--updates 200] [--users 50] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import bot
+
+STUB_MEAL = {
+    'idMeal': '52772',
+    'strMeal': 'Teriyaki Chicken Casserole',
+    'strMealThumb': '',
+    'strCategory': 'Chicken',
+    'strArea': 'Japanese',
+    'strInstructions': 'Preheat oven to 350° F. ' * 20,
+    'strYoutube': '',
+}
+for i in range(1, 21):
+    STUB_MEAL[f'strIngredient{i}'] = 'Soy Sauce' if i <= 9 else ''
+    STUB_MEAL[f'strMeasure{i}'] = '3/4 cup' if i <= 9 else ''
+
+
+class StubResponse:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def make_stub_get(latency):
+    """Заглушка requests.get: имитирует задержку сети"""
+    def stub_get(url, timeout=None):
+        time.sleep(latency)
+        return StubResponse({'meals': [STUB_MEAL]})
+    return stub_get
+
+
+class StubQuery:
+    def __init__(self, user_id, data):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+
+def make_update(user_id):
+    query = StubQuery(user_id, 'random_recipe')
+    return SimpleNamespace(effective_user=query.from_user, callback_query=query)
+
+
+async def run(workers, updates, users):
+    processor = bot.PerUserUpdateProcessor(workers)
+    async with processor:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            processor.process_update(update, bot.button_callback(update, None))
+            for update in (make_update(i % users) for i in range(updates))
+        ))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot.DB_PATH = os.path.join(tmp, 'recipes.db')
+        bot.CACHE_DB_PATH = os.path.join(tmp, 'cache.db')
+        bot.requests.get = make_stub_get(args.latency)
+        bot.init_database()
+        bot.init_cache()
+
+        print(f"{'workers':>8} {'seconds':>9} {'updates/s':>10}")
+        for workers in args.workers:
+            elapsed = asyncio.run(run(workers, args.updates, args.users))
+            print(f"{workers:>8} {elapsed:>9.2f} {args.updates / elapsed:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,422 @@
+import asyncio
+import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import os
 import requests
 import sqlite3
+import tempfile
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+import config
 from config import BOT_TOKEN, LOG_LEVEL, LOG_FORMAT
+from favorites_io import ImportParseError, detect_format, export_favorites, import_favorites
+from ingredients import meal_ingredients, parse_ingredients
+from log_setup import current_update, setup_logging
+from snapshot import Snapshot, write_snapshot
 
-# Настройка логирования
-logging.basicConfig(
-    format=LOG_FORMAT,
-    level=getattr(logging, LOG_LEVEL)
-)
+# Необязательные настройки (если их нет в config.py, используются значения по умолчанию)
+DB_PATH = getattr(config, 'DB_PATH', 'recipes.db')
+CACHE_DB_PATH = getattr(config, 'CACHE_DB_PATH', 'cache.db')
+CACHE_TTL = getattr(config, 'CACHE_TTL', 3600)
+CONCURRENT_UPDATES = getattr(config, 'CONCURRENT_UPDATES', 8)
+API_TIMEOUT = getattr(config, 'API_TIMEOUT', 10)
+LOG_SAMPLE_RATE = getattr(config, 'LOG_SAMPLE_RATE', 1.0)
+SNAPSHOT_PATH = getattr(config, 'SNAPSHOT_PATH', 'snapshot.bin')
+SNAPSHOT_INTERVAL = getattr(config, 'SNAPSHOT_INTERVAL', 300)
+SNAPSHOT_POPULAR_LIMIT = getattr(config, 'SNAPSHOT_POPULAR_LIMIT', 50)
+FAVORITES_TTL = getattr(config, 'FAVORITES_TTL', 60)
+IMPORT_WAIT_TIMEOUT = getattr(config, 'IMPORT_WAIT_TIMEOUT', 600)
+
+# Версия схемы БД (PRAGMA user_version); при совпадении проверка таблиц при старте пропускается
+SCHEMA_VERSION = 4
+# Версия формата данных в снимке (карточки рецептов, ответы API)
+SNAPSHOT_DATA_VERSION = 3
+
+# Настройка логирования (вывод в фоновом потоке, LOG_FORMAT = 'json' - структурированные записи)
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE)
 logger = logging.getLogger(__name__)
 
+def get_db_connection(path=None):
+    """Открыть соединение с SQLite, безопасное для нескольких процессов бота"""
+    # timeout/busy_timeout: при конкурентной записи ждем освобождения блокировки вместо ошибки
+    conn = sqlite3.connect(path or DB_PATH, timeout=30)
+    conn.execute('PRAGMA busy_timeout = 30000')
+    return conn
+
+def _db_execute(sql, params, fetch):
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(sql, params)
+        if fetch == 'all':
+            result = cursor.fetchall()
+        elif fetch == 'one':
+            result = cursor.fetchone()
+        else:
+            result = cursor.rowcount
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+async def db_execute(sql, params=(), fetch=None):
+    """Запрос к БД в пуле потоков: ожидание блокировки не останавливает цикл событий.
+    fetch: 'all', 'one' или None (вернуть число измененных строк)"""
+    return await asyncio.to_thread(_db_execute, sql, params, fetch)
+
+# Обработка обновлений с сохранением порядка для каждого пользователя
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений: разные пользователи обслуживаются
+    одновременно (до max_concurrent_updates), обновления одного пользователя -
+    строго по очереди"""
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}
+        self._executor = None
+
+    @staticmethod
+    def _update_key(update):
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, 'effective_chat', None)
+        return chat.id if chat is not None else None
+
+    @staticmethod
+    def _update_route(update):
+        """Короткое имя маршрута обновления для логов"""
+        query = getattr(update, 'callback_query', None)
+        if query is not None:
+            return 'callback:' + (query.data or '').rstrip('0123456789_')
+        message = getattr(update, 'message', None)
+        text = getattr(message, 'text', None) or ''
+        if text.startswith('/'):
+            return 'command:' + text.split()[0]
+        return 'message'
+
+    async def process_update(self, update, coroutine):
+        """Сначала очередь пользователя, затем общий лимит обработчиков.
+
+        BaseUpdateProcessor.process_update занимает слот семафора до вызова
+        do_process_update, поэтому ожидающие обновления одного пользователя
+        занимали бы все слоты. Здесь слот берет только выполняемое обновление.
+        """
+        key = self._update_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        # Замок и счетчик ожидающих; замок удаляется, когда очередь пользователя пуста
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        context = (getattr(update, 'update_id', None), self._update_route(update))
+        token = current_update.set(context)
+        started = time.perf_counter()
+        try:
+            await coroutine
+        finally:
+            if logger.isEnabledFor(logging.INFO):
+                duration_ms = round((time.perf_counter() - started) * 1000, 1)
+                logger.info('Обновление обработано за %s мс', duration_ms,
+                            extra={'sampled': True, 'duration_ms': duration_ms})
+            current_update.reset(token)
+
+    async def initialize(self):
+        # Блокирующие запросы к API выполняются в потоках: пул по числу обработчиков
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_updates)
+        asyncio.get_running_loop().set_default_executor(self._executor)
+
+    async def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+# Общий кэш ответов API (отдельный файл SQLite, общий для всех процессов бота)
+def init_cache():
+    """Инициализация файла кэша ответов API"""
+    conn = get_db_connection(CACHE_DB_PATH)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS api_cache (
+            url TEXT PRIMARY KEY,
+            body TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+def _fetch_json_sync(url, use_cache):
+    """Получить JSON по URL с учетом общего кэша (выполняется в потоке).
+    Возвращает (данные, время истечения записи в кэше)"""
+    if use_cache:
+        conn = get_db_connection(CACHE_DB_PATH)
+        row = conn.execute('SELECT body, expires_at FROM api_cache WHERE url = ? AND expires_at > ?', (url, time.time())).fetchone()
+        conn.close()
+        if row:
+            return json.loads(row[0]), row[1]
+
+    response = requests.get(url, timeout=API_TIMEOUT)
+    data = response.json()
+    expires_at = time.time() + CACHE_TTL
+
+    if use_cache:
+        conn = get_db_connection(CACHE_DB_PATH)
+        conn.execute('INSERT OR REPLACE INTO api_cache (url, body, expires_at) VALUES (?, ?, ?)',
+                     (url, json.dumps(data), expires_at))
+        conn.commit()
+        conn.close()
+    return data, expires_at
+
+async def fetch_json(url, use_cache=True):
+    """Запрос к API без блокировки цикла событий"""
+    if use_cache:
+        data = get_hot_api_response(url)
+        if data is not None:
+            return data
+
+    data, expires_at = await asyncio.to_thread(_fetch_json_sync, url, use_cache)
+    if use_cache:
+        remember_api_response(url, data, expires_at)
+    return data
+
+# Горячие данные в памяти процесса (периодически сохраняются в снимок)
+# Словари упорядочены по последнему обращению; при переполнении вытесняются самые давние записи
+API_MEMORY_CACHE_SIZE = 1000
+RECIPE_CARDS_SIZE = 500
+FAVORITES_INDEX_SIZE = 1000
+api_memory_cache = {}   # url -> (данные, время истечения)
+recipe_cards = {}       # recipe_id -> готовая карточка рецепта
+favorites_index = {}    # user_id -> ([[recipe_id, recipe_name, rating], ...], время истечения)
+warm_snapshot = None    # снимок, загруженный при старте
+snapshot_favorites_expires_at = 0  # до этого времени избранному из снимка можно доверять
+
+def get_hot_api_response(url):
+    """Ответ API из памяти или из снимка"""
+    entry = api_memory_cache.get(url)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+
+    # Ответ из снимка живет до своего исходного срока, а не CACHE_TTL с момента загрузки
+    if warm_snapshot is not None:
+        entry = warm_snapshot.get('api', url)
+        if entry is not None and entry['expires_at'] > time.time():
+            remember_api_response(url, entry['data'], entry['expires_at'])
+            return entry['data']
+    return None
+
+def _remember(cache, size, key, value):
+    """Записать значение последним; самая давняя запись вытесняется при переполнении"""
+    cache.pop(key, None)
+    if len(cache) >= size:
+        del cache[next(iter(cache))]
+    cache[key] = value
+
+def remember_api_response(url, data, expires_at=None):
+    """Сохранить ответ API в памяти (самые старые записи вытесняются)"""
+    _remember(api_memory_cache, API_MEMORY_CACHE_SIZE, url, (data, expires_at or time.time() + CACHE_TTL))
+
+def render_recipe_card(recipe):
+    """Подготовить карточку рецепта (не зависит от пользователя)"""
+    head = f"🍳 **{recipe['strMeal']}**\n\n"
+    head += f"📋 **Категория:** {recipe['strCategory']}\n"
+    head += f"🌍 **Кухня:** {recipe['strArea']}\n"
+
+    body = f"\n📋 **Ингредиенты:**\n"
+    body += "\n".join(f"• {measure} {ingredient}" for ingredient, measure in meal_ingredients(recipe))
+    body += "\n\n📝 **Инструкция:**\n"
+    body += recipe['strInstructions'][:500] + "..." if len(recipe['strInstructions']) > 500 else recipe['strInstructions']
+    
+    # Добавляем ссылку на видеорецепт, если есть
+    youtube = recipe['strYoutube'].strip() if recipe['strYoutube'] else ''
+    if youtube:
+        body += f"\n\n🎥 **Видеорецепт:**\n"
+        body += f"📺 {recipe['strYoutube']}"
+    
+    return {'head': head, 'body': body, 'youtube': youtube and recipe['strYoutube']}
+
+async def get_recipe_card(recipe_id):
+    """Карточка рецепта из памяти, снимка или API; None, если рецепт не найден"""
+    card = recipe_cards.get(recipe_id)
+    if card is None and warm_snapshot is not None:
+        card = warm_snapshot.get('cards', recipe_id)
+    if card is None:
+        recipe_data = await fetch_json(f"https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}")
+        if not recipe_data['meals']:
+            return None
+        card = render_recipe_card(recipe_data['meals'][0])
+    _remember(recipe_cards, RECIPE_CARDS_SIZE, recipe_id, card)
+    return card
+
+FAVORITES_QUERY = '''
+    SELECT recipe_id, recipe_name, rating
+    FROM favorite_recipes 
+    WHERE user_id = ? 
+    ORDER BY rating DESC, added_date DESC
+'''
+
+async def load_user_favorites(user_id):
+    """Прочитать избранное пользователя из БД в индекс"""
+    rows = await db_execute(FAVORITES_QUERY, (user_id,), fetch='all')
+    favorites = [list(row) for row in rows]
+    _remember(favorites_index, FAVORITES_INDEX_SIZE, user_id, (favorites, time.time() + FAVORITES_TTL))
+    return favorites
+
+async def get_user_favorites(user_id):
+    """Избранное пользователя, отсортированное по рейтингу (убывание).
+
+    Записи индекса живут FAVORITES_TTL секунд, поэтому изменения из других
+    процессов (например, favorites_io.py import) видны не позже чем через это время.
+    """
+    now = time.time()
+    entry = favorites_index.get(user_id)
+    if entry is not None and entry[1] > now:
+        _remember(favorites_index, FAVORITES_INDEX_SIZE, user_id, entry)
+        return entry[0]
+
+    # Снимок сверен с БД при загрузке и годится только в течение FAVORITES_TTL
+    if warm_snapshot is not None and now < snapshot_favorites_expires_at:
+        favorites = warm_snapshot.get('favorites', user_id)
+        if favorites is not None:
+            _remember(favorites_index, FAVORITES_INDEX_SIZE, user_id, (favorites, snapshot_favorites_expires_at))
+            return favorites
+
+    return await load_user_favorites(user_id)
+
+async def find_favorite(user_id, recipe_id):
+    """Запись [recipe_id, recipe_name, rating] из избранного или None"""
+    for entry in await get_user_favorites(user_id):
+        if entry[0] == recipe_id:
+            return entry
+    return None
+
+def favorites_fingerprint(conn):
+    """Отпечаток таблицы избранного: меняется при изменениях извне бота"""
+    row = conn.execute('SELECT COUNT(*), COALESCE(MAX(id), 0), TOTAL(rating * id) FROM favorite_recipes').fetchone()
+    return list(row)
+
+def _read_favorites_for_snapshot(user_ids):
+    """Избранное пользователей и отпечаток таблицы из одной транзакции чтения (выполняется в потоке)"""
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN')
+        fingerprint = favorites_fingerprint(conn)
+        favorites = {
+            user_id: [list(row) for row in conn.execute(FAVORITES_QUERY, (user_id,)).fetchall()]
+            for user_id in user_ids
+        }
+        conn.rollback()
+        return fingerprint, favorites
+    finally:
+        conn.close()
+
+# Снимок горячих данных
+def load_snapshot():
+    """Загрузить снимок при старте"""
+    global warm_snapshot, snapshot_favorites_expires_at
+    warm_snapshot = Snapshot.open(SNAPSHOT_PATH)
+    if warm_snapshot is None:
+        return
+    # Избранное могли изменить, пока бот был остановлен
+    conn = get_db_connection()
+    fingerprint = favorites_fingerprint(conn)
+    conn.close()
+    if warm_snapshot.meta.get('favorites_fingerprint') == fingerprint:
+        snapshot_favorites_expires_at = time.time() + FAVORITES_TTL
+    else:
+        warm_snapshot.drop_section('favorites')
+    if warm_snapshot.meta.get('data_version') != SNAPSHOT_DATA_VERSION:
+        warm_snapshot.drop_section('cards')
+        warm_snapshot.drop_section('api')
+
+async def save_snapshot():
+    """Записать снимок горячих данных (категории, популярные рецепты, карточки, избранное)"""
+    global warm_snapshot, snapshot_favorites_expires_at
+
+    # Категории и популярные рецепты всегда попадают в снимок; ошибка API по одному
+    # элементу не должна лишать снимка остальных данных
+    try:
+        await fetch_json("https://www.themealdb.com/api/json/v1/1/categories.php")
+    except Exception as e:
+        logger.warning("Снимок: не удалось получить категории: %s", e)
+    rows = await db_execute('''
+        SELECT recipe_id FROM favorite_recipes 
+        GROUP BY recipe_id 
+        ORDER BY COUNT(*) DESC 
+        LIMIT ?
+    ''', (SNAPSHOT_POPULAR_LIMIT,), fetch='all')
+    popular_cards = {}
+    for recipe_id in [row[0] for row in rows]:
+        try:
+            card = await get_recipe_card(recipe_id)
+        except Exception as e:
+            logger.warning("Снимок: не удалось получить рецепт %s: %s", recipe_id, e)
+            continue
+        if card is not None:
+            popular_cards[recipe_id] = card
+
+    # Избранное перечитывается вместе с отпечатком, чтобы снимок был согласован с БД
+    read_started = time.time()
+    fingerprint, favorites = await asyncio.to_thread(_read_favorites_for_snapshot, list(favorites_index))
+    now = time.time()
+
+    # Копии словарей снимаются в потоке цикла событий, запись файла - в отдельном потоке
+    sections = {
+        'api': {
+            url: {'data': data, 'expires_at': expires_at}
+            for url, (data, expires_at) in api_memory_cache.items() if expires_at > now
+        },
+        # Популярные карточки и недавно открытые (recipe_cards ограничен RECIPE_CARDS_SIZE)
+        'cards': {**recipe_cards, **popular_cards},
+        'favorites': favorites,
+    }
+    meta = {'created': now, 'favorites_fingerprint': fingerprint, 'data_version': SNAPSHOT_DATA_VERSION}
+    tmp_path = SNAPSHOT_PATH + '.tmp'
+    await asyncio.to_thread(write_snapshot, tmp_path, sections, meta)
+
+    # Старый снимок закрывается перед заменой файла (mmap мешает замене в Windows)
+    if warm_snapshot is not None:
+        warm_snapshot.close()
+    os.replace(tmp_path, SNAPSHOT_PATH)
+    warm_snapshot = Snapshot.open(SNAPSHOT_PATH)
+    snapshot_favorites_expires_at = read_started + FAVORITES_TTL
+
+async def snapshot_loop():
+    """Периодическая запись снимка"""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await save_snapshot()
+        except Exception as e:
+            logger.error("Ошибка при сохранении снимка: %s", e)
+
 # Инициализация базы данных
 def init_database():
     """Инициализация базы данных для избранных рецептов"""
-    conn = sqlite3.connect('recipes.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
+    # WAL позволяет нескольким процессам читать во время записи
+    cursor.execute('PRAGMA journal_mode = WAL')
+    
+    # Схема актуальна - проверять таблицы не нужно
+    cursor.execute('PRAGMA user_version')
+    version = cursor.fetchone()[0]
+    if version == SCHEMA_VERSION:
+        conn.close()
+        return
     
     # Проверяем, существует ли таблица
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='favorite_recipes'")
@@ -46,6 +446,34 @@ def init_database():
             # Добавляем поле rating к существующей таблице
             cursor.execute('ALTER TABLE favorite_recipes ADD COLUMN rating INTEGER DEFAULT 0')
     
+    # Ингредиенты рецептов, разобранные один раз: (количество, единица, ингредиент)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recipe_ingredients (
+            recipe_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            ingredient TEXT NOT NULL,
+            quantity REAL,
+            unit TEXT NOT NULL DEFAULT '',
+            measure TEXT,
+            PRIMARY KEY (recipe_id, position)
+        )
+    ''')
+    
+    # План питания: рецепты из избранного, выбранные для списка покупок
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meal_plan (
+            user_id INTEGER NOT NULL,
+            recipe_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, recipe_id)
+        )
+    ''')
+    
+    # В версии 2 незнакомые единицы («cloves», «head») терялись, в версии 3 единицами
+    # считались слова о размере («3 large») - разберем ингредиенты заново
+    if version in (2, 3):
+        cursor.execute('DELETE FROM recipe_ingredients')
+    
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
     conn.close()
 
@@ -114,6 +542,16 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await show_rating_menu(query)
     elif query.data.startswith("set_rating_"):
         await set_recipe_rating(query)
+    elif query.data == "meal_plan":
+        await show_meal_plan(query)
+    elif query.data == "shopping_list":
+        await show_shopping_list(query)
+    elif query.data == "plan_clear":
+        await clear_meal_plan(query)
+    elif query.data.startswith("plan_add_"):
+        await add_to_meal_plan(query)
+    elif query.data.startswith("plan_remove_"):
+        await remove_from_meal_plan(query)
 
 async def show_search_menu(query):
     """Показать меню поиска рецептов"""
@@ -136,17 +574,8 @@ async def show_favorites(query):
     """Показать избранные рецепты пользователя"""
     user_id = query.from_user.id
     
-    # Получаем избранные рецепты из БД, сортируем по рейтингу (убывание)
-    conn = sqlite3.connect('recipes.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT recipe_id, recipe_name, recipe_image, rating
-        FROM favorite_recipes 
-        WHERE user_id = ? 
-        ORDER BY rating DESC, added_date DESC
-    ''', (user_id,))
-    favorites = cursor.fetchall()
-    conn.close()
+    # Получаем избранные рецепты, отсортированные по рейтингу (убывание)
+    favorites = await get_user_favorites(user_id)
     
     if not favorites:
         keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]]
@@ -164,12 +593,13 @@ async def show_favorites(query):
     text = "❤️ **Мои избранные рецепты:**\n\n"
     keyboard = []
     
-    for i, (recipe_id, recipe_name, recipe_image, rating) in enumerate(favorites[:10]):  # Ограничиваем 10 рецептами
+    for i, (recipe_id, recipe_name, rating) in enumerate(favorites[:10]):  # Ограничиваем 10 рецептами
         stars = "⭐" * rating if rating > 0 else "❌ Нет оценки"
         text += f"{i+1}. {recipe_name}\n"
         text += f"   {stars}\n\n"
         keyboard.append([InlineKeyboardButton(f"👁️ {recipe_name[:20]}...", callback_data=f"view_recipe_{recipe_id}")])
     
+    keyboard.append([InlineKeyboardButton("📅 План питания и покупки", callback_data="meal_plan")])
     keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -194,6 +624,21 @@ async def show_main_menu(query):
         parse_mode='Markdown'
     )
 
+def _save_favorite(user_id, recipe_id, recipe):
+    """Записать рецепт в избранное вместе с разобранными ингредиентами (выполняется в потоке)"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO favorite_recipes 
+            (user_id, recipe_id, recipe_name, recipe_image, recipe_instructions)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, recipe_id, recipe['strMeal'], recipe['strMealThumb'], recipe['strInstructions']))
+        store_recipe_ingredients(conn, recipe_id, recipe)
+        conn.commit()
+    finally:
+        conn.close()
+
 async def add_to_favorites(query):
     """Добавить рецепт в избранное"""
     recipe_id = query.data.replace("add_favorite_", "")
@@ -201,144 +646,67 @@ async def add_to_favorites(query):
     
     # Получаем данные рецепта из API
     try:
-        response = requests.get(f"https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}")
-        recipe_data = response.json()
+        recipe_data = await fetch_json(f"https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}")
         
         if recipe_data['meals']:
             recipe = recipe_data['meals'][0]
-            recipe_name = recipe['strMeal']
-            recipe_image = recipe['strMealThumb']
-            recipe_instructions = recipe['strInstructions']
             
             # Сохраняем в БД
-            conn = sqlite3.connect('recipes.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR IGNORE INTO favorite_recipes 
-                (user_id, recipe_id, recipe_name, recipe_image, recipe_instructions)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, recipe_id, recipe_name, recipe_image, recipe_instructions))
-            conn.commit()
-            conn.close()
+            await asyncio.to_thread(_save_favorite, user_id, recipe_id, recipe)
+            await load_user_favorites(user_id)
             
             await query.answer("✅ Рецепт добавлен в избранное!")
         else:
             await query.answer("❌ Рецепт не найден!")
     except Exception as e:
-        logger.error(f"Ошибка при добавлении в избранное: {e}")
+        logger.error("Ошибка при добавлении в избранное: %s", e)
         await query.answer("❌ Ошибка при добавлении в избранное")
 
+def _delete_favorite(user_id, recipe_id):
+    """Удалить рецепт из избранного и плана питания (выполняется в потоке)"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM favorite_recipes WHERE user_id = ? AND recipe_id = ?', (user_id, recipe_id))
+        cursor.execute('DELETE FROM meal_plan WHERE user_id = ? AND recipe_id = ?', (user_id, recipe_id))
+        conn.commit()
+    finally:
+        conn.close()
+
 async def remove_from_favorites(query):
     """Удалить рецепт из избранного"""
     recipe_id = query.data.replace("remove_favorite_", "")
     user_id = query.from_user.id
     
-    conn = sqlite3.connect('recipes.db')
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM favorite_recipes WHERE user_id = ? AND recipe_id = ?', (user_id, recipe_id))
-    conn.commit()
-    conn.close()
+    await asyncio.to_thread(_delete_favorite, user_id, recipe_id)
+    await load_user_favorites(user_id)
     
     await query.answer("🗑️ Рецепт удален из избранного")
 
 async def show_recipe_details(query):
     """Показать детали рецепта"""
     recipe_id = query.data.replace("view_recipe_", "")
-    user_id = query.from_user.id
-    
-    try:
-        response = requests.get(f"https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}")
-        recipe_data = response.json()
-        
-        if recipe_data['meals']:
-            recipe = recipe_data['meals'][0]
-            
-            # Проверяем, есть ли рецепт в избранном
-            conn = sqlite3.connect('recipes.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT 1, rating FROM favorite_recipes WHERE user_id = ? AND recipe_id = ?', (user_id, recipe_id))
-            result = cursor.fetchone()
-            is_favorite = result is not None
-            current_rating = result[1] if result else 0
-            conn.close()
-            
-            # Формируем текст рецепта
-            text = f"🍳 **{recipe['strMeal']}**\n\n"
-            text += f"📋 **Категория:** {recipe['strCategory']}\n"
-            text += f"🌍 **Кухня:** {recipe['strArea']}\n"
-            
-            if is_favorite and current_rating > 0:
-                stars = "⭐" * current_rating
-                text += f"⭐ **Ваш рейтинг:** {stars}\n"
-            
-            text += f"\n📋 **Ингредиенты:**\n"
-            
-            # Собираем ингредиенты
-            ingredients = []
-            for i in range(1, 21):
-                ingredient = recipe[f'strIngredient{i}']
-                measure = recipe[f'strMeasure{i}']
-                if ingredient and ingredient.strip():
-                    ingredients.append(f"• {measure} {ingredient}")
-            
-            text += "\n".join(ingredients[:10])  # Показываем первые 10 ингредиентов
-            text += "\n\n📝 **Инструкция:**\n"
-            text += recipe['strInstructions'][:500] + "..." if len(recipe['strInstructions']) > 500 else recipe['strInstructions']
-            
-            # Добавляем ссылку на видеорецепт, если есть
-            if recipe['strYoutube'] and recipe['strYoutube'].strip():
-                text += f"\n\n🎥 **Видеорецепт:**\n"
-                text += f"📺 {recipe['strYoutube']}"
-            
-            # Создаем кнопки
-            keyboard = []
-            if is_favorite:
-                keyboard.append([InlineKeyboardButton("🗑️ Удалить из избранного", callback_data=f"remove_favorite_{recipe_id}")])
-                keyboard.append([InlineKeyboardButton("⭐ Оценить рецепт", callback_data=f"rate_recipe_{recipe_id}")])
-            else:
-                keyboard.append([InlineKeyboardButton("❤️ Добавить в избранное", callback_data=f"add_favorite_{recipe_id}")])
-            
-            # Добавляем кнопку видеорецепта, если есть
-            if recipe['strYoutube'] and recipe['strYoutube'].strip():
-                keyboard.append([InlineKeyboardButton("🎥 Смотреть видеорецепт", url=recipe['strYoutube'])])
-            
-            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")])
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown'
-            )
-        else:
-            await query.answer("❌ Рецепт не найден!")
-    except Exception as e:
-        logger.error(f"Ошибка при получении рецепта: {e}")
-        await query.answer("❌ Ошибка при получении рецепта")
+    await show_recipe_details_by_id(query, recipe_id)
 
 # Функции для работы с API TheMealDB
 
 async def show_random_recipe(query):
     """Показать случайный рецепт"""
     try:
-        response = requests.get("https://www.themealdb.com/api/json/v1/1/random.php")
-        recipe_data = response.json()
+        recipe_data = await fetch_json("https://www.themealdb.com/api/json/v1/1/random.php", use_cache=False)
         
         if recipe_data['meals']:
             recipe = recipe_data['meals'][0]
             recipe_id = recipe['idMeal']
             recipe_name = recipe['strMeal']
             recipe_image = recipe['strMealThumb']
+            # Карточка пригодится для кнопки "Подробнее"
+            if recipe_id not in recipe_cards:
+                _remember(recipe_cards, RECIPE_CARDS_SIZE, recipe_id, render_recipe_card(recipe))
             
             # Проверяем, есть ли рецепт в избранном
             user_id = query.from_user.id
-            conn = sqlite3.connect('recipes.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT 1, rating FROM favorite_recipes WHERE user_id = ? AND recipe_id = ?', (user_id, recipe_id))
-            result = cursor.fetchone()
-            is_favorite = result is not None
-            current_rating = result[1] if result else 0
-            conn.close()
+            is_favorite = await find_favorite(user_id, recipe_id) is not None
             
             text = f"🎲 **Случайный рецепт:**\n\n"
             text += f"🍳 **{recipe_name}**\n\n"
@@ -377,7 +745,7 @@ async def show_random_recipe(query):
         else:
             await query.answer("❌ Не удалось получить случайный рецепт")
     except Exception as e:
-        logger.error(f"Ошибка при получении случайного рецепта: {e}")
+        logger.error("Ошибка при получении случайного рецепта: %s", e)
         await query.answer("❌ Ошибка при получении рецепта")
 
 async def show_search_by_name_prompt(query):
@@ -397,8 +765,7 @@ async def show_search_by_name_prompt(query):
 async def show_categories_menu(query):
     """Показать меню категорий"""
     try:
-        response = requests.get("https://www.themealdb.com/api/json/v1/1/categories.php")
-        categories_data = response.json()
+        categories_data = await fetch_json("https://www.themealdb.com/api/json/v1/1/categories.php")
         
         if categories_data['categories']:
             keyboard = []
@@ -432,7 +799,7 @@ async def show_categories_menu(query):
         else:
             await query.answer("❌ Не удалось загрузить категории")
     except Exception as e:
-        logger.error(f"Ошибка при получении категорий: {e}")
+        logger.error("Ошибка при получении категорий: %s", e)
         await query.answer("❌ Ошибка при загрузке категорий")
 
 async def show_recipes_by_category(query):
@@ -440,8 +807,7 @@ async def show_recipes_by_category(query):
     category = query.data.replace("category_", "")
     
     try:
-        response = requests.get(f"https://www.themealdb.com/api/json/v1/1/filter.php?c={category}")
-        recipes_data = response.json()
+        recipes_data = await fetch_json(f"https://www.themealdb.com/api/json/v1/1/filter.php?c={category}")
         
         if recipes_data['meals']:
             recipes = recipes_data['meals']
@@ -482,7 +848,7 @@ async def show_recipes_by_category(query):
                 parse_mode='Markdown'
             )
     except Exception as e:
-        logger.error(f"Ошибка при получении рецептов категории: {e}")
+        logger.error("Ошибка при получении рецептов категории: %s", e)
         await query.answer("❌ Ошибка при загрузке рецептов")
 
 async def show_recipe_details_by_id(query, recipe_id):
@@ -490,60 +856,38 @@ async def show_recipe_details_by_id(query, recipe_id):
     user_id = query.from_user.id
     
     try:
-        response = requests.get(f"https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}")
-        recipe_data = response.json()
+        card = await get_recipe_card(recipe_id)
         
-        if recipe_data['meals']:
-            recipe = recipe_data['meals'][0]
-            
+        if card:
             # Проверяем, есть ли рецепт в избранном
-            conn = sqlite3.connect('recipes.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT 1, rating FROM favorite_recipes WHERE user_id = ? AND recipe_id = ?', (user_id, recipe_id))
-            result = cursor.fetchone()
-            is_favorite = result is not None
-            current_rating = result[1] if result else 0
-            conn.close()
+            favorite = await find_favorite(user_id, recipe_id)
+            is_favorite = favorite is not None
+            current_rating = favorite[2] if favorite else 0
             
             # Формируем текст рецепта
-            text = f"🍳 **{recipe['strMeal']}**\n\n"
-            text += f"📋 **Категория:** {recipe['strCategory']}\n"
-            text += f"🌍 **Кухня:** {recipe['strArea']}\n"
+            text = card['head']
             
             if is_favorite and current_rating > 0:
                 stars = "⭐" * current_rating
                 text += f"⭐ **Ваш рейтинг:** {stars}\n"
             
-            text += f"\n📋 **Ингредиенты:**\n"
-            
-            # Собираем ингредиенты
-            ingredients = []
-            for i in range(1, 21):
-                ingredient = recipe[f'strIngredient{i}']
-                measure = recipe[f'strMeasure{i}']
-                if ingredient and ingredient.strip():
-                    ingredients.append(f"• {measure} {ingredient}")
-            
-            text += "\n".join(ingredients[:10])  # Показываем первые 10 ингредиентов
-            text += "\n\n📝 **Инструкция:**\n"
-            text += recipe['strInstructions'][:500] + "..." if len(recipe['strInstructions']) > 500 else recipe['strInstructions']
-            
-            # Добавляем ссылку на видеорецепт, если есть
-            if recipe['strYoutube'] and recipe['strYoutube'].strip():
-                text += f"\n\n🎥 **Видеорецепт:**\n"
-                text += f"📺 {recipe['strYoutube']}"
+            text += card['body']
             
             # Создаем кнопки
             keyboard = []
             if is_favorite:
                 keyboard.append([InlineKeyboardButton("🗑️ Удалить из избранного", callback_data=f"remove_favorite_{recipe_id}")])
                 keyboard.append([InlineKeyboardButton("⭐ Оценить рецепт", callback_data=f"rate_recipe_{recipe_id}")])
+                if await is_in_meal_plan(user_id, recipe_id):
+                    keyboard.append([InlineKeyboardButton("📅 Убрать из плана питания", callback_data=f"plan_remove_{recipe_id}")])
+                else:
+                    keyboard.append([InlineKeyboardButton("📅 Добавить в план питания", callback_data=f"plan_add_{recipe_id}")])
             else:
                 keyboard.append([InlineKeyboardButton("❤️ Добавить в избранное", callback_data=f"add_favorite_{recipe_id}")])
             
             # Добавляем кнопку видеорецепта, если есть
-            if recipe['strYoutube'] and recipe['strYoutube'].strip():
-                keyboard.append([InlineKeyboardButton("🎥 Смотреть видеорецепт", url=recipe['strYoutube'])])
+            if card['youtube']:
+                keyboard.append([InlineKeyboardButton("🎥 Смотреть видеорецепт", url=card['youtube'])])
             
             keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")])
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -556,7 +900,7 @@ async def show_recipe_details_by_id(query, recipe_id):
         else:
             await query.answer("❌ Рецепт не найден!")
     except Exception as e:
-        logger.error(f"Ошибка при получении рецепта: {e}")
+        logger.error("Ошибка при получении рецепта: %s", e)
         await query.answer("❌ Ошибка при получении рецепта")
 
 # Функции для работы с рейтингом
@@ -567,17 +911,13 @@ async def show_rating_menu(query):
     user_id = query.from_user.id
     
     # Проверяем, есть ли рецепт в избранном
-    conn = sqlite3.connect('recipes.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT recipe_name FROM favorite_recipes WHERE user_id = ? AND recipe_id = ?', (user_id, recipe_id))
-    result = cursor.fetchone()
-    conn.close()
+    result = await find_favorite(user_id, recipe_id)
     
     if not result:
         await query.answer("❌ Рецепт не найден в избранном!")
         return
     
-    recipe_name = result[0]
+    recipe_name = result[1]
     
     keyboard = [
         [InlineKeyboardButton("⭐", callback_data=f"set_rating_{recipe_id}_1")],
@@ -614,33 +954,25 @@ async def set_recipe_rating(query):
             await query.answer("❌ Ошибка: рейтинг должен быть от 1 до 5")
             return
         
-        # Обновляем рейтинг в БД
-        conn = sqlite3.connect('recipes.db')
-        cursor = conn.cursor()
-        
         # Сначала проверяем, существует ли рецепт в избранном
-        cursor.execute('''
+        result = await db_execute('''
             SELECT recipe_name FROM favorite_recipes 
             WHERE user_id = ? AND recipe_id = ?
-        ''', (user_id, recipe_id))
+        ''', (user_id, recipe_id), fetch='one')
         
-        result = cursor.fetchone()
         if not result:
-            conn.close()
             await query.answer("❌ Рецепт не найден в избранном!")
             return
             
         recipe_name = result[0]
         
-        # Обновляем рейтинг
-        cursor.execute('''
+        # Обновляем рейтинг в БД
+        await db_execute('''
             UPDATE favorite_recipes 
             SET rating = ? 
             WHERE user_id = ? AND recipe_id = ?
         ''', (rating, user_id, recipe_id))
-        
-        conn.commit()
-        conn.close()
+        await load_user_favorites(user_id)
         
         stars = "⭐" * rating
         await query.answer(f"✅ Рейтинг {stars} установлен для '{recipe_name}'!")
@@ -651,9 +983,178 @@ async def set_recipe_rating(query):
     except ValueError:
         await query.answer("❌ Ошибка: неверный формат рейтинга")
     except Exception as e:
-        logger.error(f"Ошибка при установке рейтинга: {e}")
+        logger.error("Ошибка при установке рейтинга: %s", e)
         await query.answer("❌ Ошибка при установке рейтинга")
 
+# Функции для плана питания и списка покупок
+
+def store_recipe_ingredients(conn, recipe_id, recipe):
+    """Разобрать ингредиенты рецепта и сохранить в БД (если еще не сохранены)"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM recipe_ingredients WHERE recipe_id = ? LIMIT 1', (recipe_id,))
+    if cursor.fetchone():
+        return
+    cursor.executemany('''
+        INSERT OR IGNORE INTO recipe_ingredients 
+        (recipe_id, position, ingredient, quantity, unit, measure)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(recipe_id, *row) for row in parse_ingredients(recipe)])
+
+def _save_recipe_ingredients(recipes):
+    """Сохранить ингредиенты нескольких рецептов одной транзакцией (выполняется в потоке)"""
+    conn = get_db_connection()
+    try:
+        for recipe_id, recipe in recipes:
+            store_recipe_ingredients(conn, recipe_id, recipe)
+        conn.commit()
+    finally:
+        conn.close()
+
+async def is_in_meal_plan(user_id, recipe_id):
+    """Проверить, есть ли рецепт в плане питания"""
+    result = await db_execute('SELECT 1 FROM meal_plan WHERE user_id = ? AND recipe_id = ?', (user_id, recipe_id), fetch='one')
+    return result is not None
+
+def format_quantity(quantity, unit):
+    """Количество для списка покупок: 1.5 cup, 450 g"""
+    text = f"{round(quantity, 2):g}"
+    return f"{text} {unit}" if unit else text
+
+async def add_to_meal_plan(query):
+    """Добавить рецепт из избранного в план питания"""
+    recipe_id = query.data.replace("plan_add_", "")
+    user_id = query.from_user.id
+    
+    if await find_favorite(user_id, recipe_id) is None:
+        await query.answer("❌ Рецепт не найден в избранном!")
+        return
+    
+    await db_execute('INSERT OR IGNORE INTO meal_plan (user_id, recipe_id) VALUES (?, ?)', (user_id, recipe_id))
+    
+    await query.answer("📅 Рецепт добавлен в план питания")
+    await show_recipe_details_by_id(query, recipe_id)
+
+async def remove_from_meal_plan(query):
+    """Убрать рецепт из плана питания"""
+    recipe_id = query.data.replace("plan_remove_", "")
+    user_id = query.from_user.id
+    
+    await db_execute('DELETE FROM meal_plan WHERE user_id = ? AND recipe_id = ?', (user_id, recipe_id))
+    
+    await query.answer("🗑️ Рецепт убран из плана питания")
+    await show_recipe_details_by_id(query, recipe_id)
+
+async def clear_meal_plan(query):
+    """Очистить план питания"""
+    user_id = query.from_user.id
+    
+    await db_execute('DELETE FROM meal_plan WHERE user_id = ?', (user_id,))
+    
+    await query.answer("🗑️ План питания очищен")
+    await show_meal_plan(query)
+
+async def show_meal_plan(query):
+    """Показать план питания"""
+    user_id = query.from_user.id
+    
+    plan = await db_execute('''
+        SELECT f.recipe_id, f.recipe_name
+        FROM meal_plan mp
+        JOIN favorite_recipes f ON f.user_id = mp.user_id AND f.recipe_id = mp.recipe_id
+        WHERE mp.user_id = ?
+        ORDER BY f.recipe_name
+    ''', (user_id,), fetch='all')
+    
+    if not plan:
+        keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="my_favorites")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await query.edit_message_text(
+            "📅 **План питания**\n\n"
+            "План пока пуст.\n"
+            "Откройте рецепт из избранного и нажмите «📅 Добавить в план питания».",
+            reply_markup=reply_markup,
+            parse_mode='Markdown'
+        )
+        return
+    
+    text = "📅 **План питания:**\n\n"
+    keyboard = []
+    for i, (recipe_id, recipe_name) in enumerate(plan):
+        text += f"{i+1}. {recipe_name}\n"
+        keyboard.append([InlineKeyboardButton(f"👁️ {recipe_name[:20]}...", callback_data=f"view_recipe_{recipe_id}")])
+    
+    keyboard.append([InlineKeyboardButton("🛒 Список покупок", callback_data="shopping_list")])
+    keyboard.append([InlineKeyboardButton("🗑️ Очистить план", callback_data="plan_clear")])
+    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="my_favorites")])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await query.edit_message_text(
+        text,
+        reply_markup=reply_markup,
+        parse_mode='Markdown'
+    )
+
+async def show_shopping_list(query):
+    """Показать список покупок по плану питания"""
+    user_id = query.from_user.id
+    
+    try:
+        # Рецепты, добавленные до появления таблицы ингредиентов, разбираем один раз.
+        # Сначала загружаем все рецепты, затем пишем одной короткой транзакцией
+        missing = await db_execute('''
+            SELECT mp.recipe_id FROM meal_plan mp
+            WHERE mp.user_id = ? 
+            AND NOT EXISTS (SELECT 1 FROM recipe_ingredients ri WHERE ri.recipe_id = mp.recipe_id)
+        ''', (user_id,), fetch='all')
+        recipes = []
+        for (recipe_id,) in missing:
+            recipe_data = await fetch_json(f"https://www.themealdb.com/api/json/v1/1/lookup.php?i={recipe_id}")
+            if recipe_data['meals']:
+                recipes.append((recipe_id, recipe_data['meals'][0]))
+        if recipes:
+            await asyncio.to_thread(_save_recipe_ingredients, recipes)
+        
+        # Суммируем количества одним сгруппированным запросом
+        items = await db_execute('''
+            SELECT ri.ingredient, ri.unit, SUM(ri.quantity),
+                   GROUP_CONCAT(CASE WHEN ri.quantity IS NULL THEN ri.measure END, char(30))
+            FROM meal_plan mp
+            JOIN recipe_ingredients ri ON ri.recipe_id = mp.recipe_id
+            WHERE mp.user_id = ?
+            GROUP BY ri.ingredient, ri.unit
+            ORDER BY ri.ingredient, ri.unit
+        ''', (user_id,), fetch='all')
+        
+        keyboard = [[InlineKeyboardButton("🔙 Назад к плану", callback_data="meal_plan")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        if not items:
+            await query.edit_message_text(
+                "🛒 **Список покупок**\n\n"
+                "В плане питания нет рецептов с ингредиентами.",
+                reply_markup=reply_markup,
+                parse_mode='Markdown'
+            )
+            return
+        
+        text = "🛒 **Список покупок:**\n\n"
+        for ingredient, unit, quantity, other_measures in items:
+            amounts = []
+            if quantity is not None:
+                amounts.append(format_quantity(quantity, unit))
+            if other_measures:
+                amounts.extend(measure for measure in dict.fromkeys(other_measures.split('\x1e')) if measure)
+            text += f"• {ingredient}" + (f" — {', '.join(amounts)}" if amounts else "") + "\n"
+        
+        await query.edit_message_text(
+            text[:4000],
+            reply_markup=reply_markup,
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        logger.error("Ошибка при составлении списка покупок: %s", e)
+        await query.answer("❌ Ошибка при составлении списка покупок")
+
 # Обработчик текстовых сообщений
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик всех текстовых сообщений"""
@@ -661,7 +1162,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.lower()
     
     # Логирование
-    logger.info(f'Пользователь ({update.message.chat.id}) в {message_type}: "{text}"')
+    logger.info('Пользователь (%s) в %s: "%s"', update.message.chat.id, message_type, text, extra={'sampled': True})
     
     # Проверка на слово "привет"
     if "привет" in text:
@@ -678,8 +1179,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def search_recipe_by_name(update: Update, search_query: str):
     """Поиск рецепта по названию"""
     try:
-        response = requests.get(f"https://www.themealdb.com/api/json/v1/1/search.php?s={search_query}")
-        recipes_data = response.json()
+        recipes_data = await fetch_json(f"https://www.themealdb.com/api/json/v1/1/search.php?s={search_query}")
         
         if recipes_data['meals']:
             recipes = recipes_data['meals']
@@ -727,15 +1227,130 @@ async def search_recipe_by_name(update: Update, search_query: str):
                 parse_mode='Markdown'
             )
     except Exception as e:
-        logger.error(f"Ошибка при поиске рецепта: {e}")
+        logger.error("Ошибка при поиске рецепта: %s", e)
         await update.message.reply_text(
             "❌ Ошибка при поиске рецепта. Попробуйте позже."
         )
 
+# Экспорт и импорт избранного
+
+def _export_to_file(user_id, fmt, path):
+    """Выгрузить избранное пользователя в файл (выполняется в потоке)"""
+    conn = get_db_connection()
+    try:
+        with open(path, 'w', encoding='utf-8', newline='') as out:
+            return export_favorites(conn, out, fmt, user_id)
+    finally:
+        conn.close()
+
+def _import_from_file(user_id, fmt, path):
+    """Загрузить избранное пользователя из файла (выполняется в потоке)"""
+    conn = get_db_connection()
+    try:
+        with open(path, encoding='utf-8', newline='') as src:
+            return import_favorites(conn, src, fmt, user_id)
+    finally:
+        conn.close()
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /export [csv|json]"""
+    user_id = update.effective_user.id
+    fmt = 'json' if context.args and context.args[0].lower() in ('json', 'jsonl') else 'csv'
+    filename = f"favorites_{user_id}.{'csv' if fmt == 'csv' else 'jsonl'}"
+    
+    # Файл пишется на диск порциями и отправляется как документ
+    fd, path = tempfile.mkstemp(suffix='_' + filename)
+    os.close(fd)
+    try:
+        count = await asyncio.to_thread(_export_to_file, user_id, fmt, path)
+        if not count:
+            await update.message.reply_text("❤️ У вас пока нет избранных рецептов для экспорта.")
+            return
+        with open(path, 'rb') as document:
+            await update.message.reply_document(
+                document=document,
+                filename=filename,
+                caption=f"📦 Избранные рецепты: {count}"
+            )
+    except Exception as e:
+        logger.error("Ошибка при экспорте избранного: %s", e)
+        await update.message.reply_text("❌ Ошибка при экспорте избранного")
+    finally:
+        os.remove(path)
+
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /import - ожидание файла"""
+    context.user_data['awaiting_import'] = time.time() + IMPORT_WAIT_TIMEOUT
+    await update.message.reply_text(
+        "📥 Отправьте файл с избранными рецептами (.csv или .jsonl),\n"
+        "полученный командой /export."
+    )
+
+async def handle_import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Импорт избранного из присланного файла"""
+    # Файл принимается только сразу после /import и не позже IMPORT_WAIT_TIMEOUT
+    if context.user_data.pop('awaiting_import', 0) < time.time():
+        return
+    
+    user_id = update.effective_user.id
+    document = update.message.document
+    fmt = detect_format(document.file_name or '')
+    
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_drive(path)
+        try:
+            imported, skipped = await asyncio.to_thread(_import_from_file, user_id, fmt, path)
+        finally:
+            # Записи до ошибки разбора уже сохранены - индекс обновляется в любом случае
+            await load_user_favorites(user_id)
+        
+        text = f"✅ Импортировано рецептов: {imported}"
+        if skipped:
+            text += f"\n⚠️ Пропущено некорректных записей: {skipped}"
+        await update.message.reply_text(text)
+    except ImportParseError as e:
+        if e.imported:
+            text = f"⚠️ Импортировано рецептов: {e.imported}, затем импорт остановлен: {e}"
+        else:
+            text = f"❌ Неверный формат файла: {e}"
+        if e.skipped:
+            text += f"\n⚠️ Пропущено некорректных записей: {e.skipped}"
+        await update.message.reply_text(text)
+    except Exception as e:
+        logger.error("Ошибка при импорте избранного: %s", e)
+        await update.message.reply_text("❌ Ошибка при импорте избранного")
+    finally:
+        os.remove(path)
+
+async def cancel_import_wait(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Любое сообщение, кроме файла, отменяет ожидание импорта"""
+    context.user_data.pop('awaiting_import', None)
+
 # Обработчик ошибок
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок"""
-    logger.error(f'Ошибка: {context.error}')
+    logger.error('Ошибка: %s', context.error)
+
+async def start_snapshot_loop(app: Application):
+    """Запуск периодической записи снимка"""
+    app.bot_data['snapshot_task'] = asyncio.create_task(snapshot_loop())
+
+async def stop_snapshot_loop(app: Application):
+    """Остановка записи снимка и сохранение итогового снимка.
+
+    Вызывается как post_stop: до Application.shutdown(), пока пул потоков
+    обработчиков еще работает (после shutdown asyncio.to_thread недоступен).
+    """
+    task = app.bot_data.pop('snapshot_task', None)
+    if task is not None:
+        task.cancel()
+    try:
+        await save_snapshot()
+    except Exception as e:
+        logger.error("Ошибка при сохранении снимка: %s", e)
 
 def main():
     """Основная функция запуска бота"""
@@ -750,21 +1365,60 @@ def main():
         print("3. Замените 'YOUR_BOT_TOKEN' на ваш токен")
         return
     
+    # Замер длительности этапов запуска
+    timings = {}
+    started = time.perf_counter()
+    
+    def phase(name):
+        nonlocal started
+        now = time.perf_counter()
+        timings[name] = (now - started) * 1000
+        started = now
+    
     # Инициализация базы данных
     init_database()
+    phase('init_database')
+    init_cache()
+    phase('init_cache')
     print("✅ База данных инициализирована")
     
+    # Загрузка снимка горячих данных
+    load_snapshot()
+    phase('load_snapshot')
+    if warm_snapshot is not None:
+        print("✅ Снимок горячих данных загружен")
+    
     # Создание приложения
-    app = Application.builder().token(BOT_TOKEN).build()
+    # Обновления разных пользователей обрабатываются параллельно, одного пользователя - по порядку
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(start_snapshot_loop)
+        .post_stop(stop_snapshot_loop)
+        .build()
+    )
     
     # Добавление обработчиков
     app.add_handler(CommandHandler('start', start_command))
     app.add_handler(CommandHandler('test', test_command))
+    app.add_handler(CommandHandler('export', export_command))
+    app.add_handler(CommandHandler('import', import_command))
+    app.add_handler(MessageHandler(filters.Document.ALL, handle_import_document))
+    # Группа -1 выполняется до основных обработчиков (в том числе до /import, который ставит ожидание)
+    app.add_handler(MessageHandler(~filters.Document.ALL, cancel_import_wait), group=-1)
     app.add_handler(CallbackQueryHandler(button_callback))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
     # Обработчик ошибок
     app.add_error_handler(error_handler)
+    phase('build_application')
+    
+    logger.info(
+        "Время запуска: %s",
+        ", ".join(f"{name}={ms:.1f} мс" for name, ms in timings.items()),
+        extra={'startup_ms': {name: round(ms, 1) for name, ms in timings.items()}}
+    )
     
     # Запуск бота
     print("✅ Бот запущен! Нажмите Ctrl+C для остановки.")
@@ -0,0 +1,217 @@
+"""Потоковый экспорт и импорт избранных рецептов (CSV или JSON Lines).
+
+Экспорт читает таблицу курсором порциями (fetchmany), импорт разбирает файл
+построчно и пишет пакетами через executemany - в памяти держится только одна
+порция записей.
+
+Администрирование всей таблицы:
+    python favorites_io.py export favorites.csv
+    python favorites_io.py export favorites.jsonl --user 123456
+    python favorites_io.py import favorites.csv
+
+По умолчанию используется DB_PATH из config.py. Запущенный бот увидит
+импортированные записи не позже чем через FAVORITES_TTL секунд.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+FIELDS = ('user_id', 'recipe_id', 'recipe_name', 'recipe_image', 'recipe_instructions', 'rating', 'added_date')
+CHUNK_SIZE = 500
+# ID рецептов TheMealDB - короткие числа; длинный ID не поместился бы в callback_data (64 байта)
+MAX_RECIPE_ID_LENGTH = 10
+
+
+class ImportParseError(ValueError):
+    """Файл не удалось разобрать до конца; записи до ошибки уже сохранены"""
+
+    def __init__(self, message, imported, skipped):
+        super().__init__(message)
+        self.imported = imported
+        self.skipped = skipped
+
+
+def detect_format(path):
+    """'csv' или 'json' (JSON Lines) по расширению файла"""
+    return 'csv' if path.lower().endswith('.csv') else 'json'
+
+
+def iter_favorites(conn, user_id=None, chunk_size=CHUNK_SIZE):
+    """Порции строк избранного (все пользователи или один)"""
+    cursor = conn.cursor()
+    query = f"SELECT {', '.join(FIELDS)} FROM favorite_recipes"
+    if user_id is None:
+        cursor.execute(query + " ORDER BY id")
+    else:
+        cursor.execute(query + " WHERE user_id = ? ORDER BY id", (user_id,))
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def export_favorites(conn, out, fmt, user_id=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Записать избранное в текстовый файл out; возвращает число записей"""
+    count = 0
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+
+    for rows in iter_favorites(conn, user_id, chunk_size):
+        if writer is not None:
+            writer.writerows(rows)
+        else:
+            out.writelines(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n' for row in rows)
+        count += len(rows)
+        if progress:
+            progress(count)
+    return count
+
+
+def _iter_records(src, fmt):
+    """Записи из файла по одной"""
+    if fmt == 'csv':
+        yield from csv.DictReader(src)
+    else:
+        for line in src:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _text(value):
+    """Строка без пробелов по краям; None (пустая ячейка CSV, null в JSON) - пустая строка"""
+    return '' if value is None else str(value).strip()
+
+
+def _to_row(record, user_id):
+    """Кортеж для вставки или None, если запись некорректна"""
+    try:
+        row_user_id = user_id if user_id is not None else int(record['user_id'])
+        recipe_id = _text(record.get('recipe_id'))
+        recipe_name = _text(record.get('recipe_name'))
+        rating = record.get('rating')
+        # true/false в JSON - не рейтинг, хотя int(True) == 1
+        if isinstance(rating, bool):
+            return None
+        rating = int(rating or 0)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (recipe_id.isascii() and recipe_id.isdigit()) or len(recipe_id) > MAX_RECIPE_ID_LENGTH:
+        return None
+    if not recipe_name or not 0 <= rating <= 5:
+        return None
+    return (
+        row_user_id, recipe_id, recipe_name,
+        record.get('recipe_image') or None,
+        record.get('recipe_instructions') or None,
+        rating,
+        record.get('added_date') or None,
+    )
+
+
+def import_favorites(conn, src, fmt, user_id=None, batch_size=CHUNK_SIZE, progress=None):
+    """Загрузить избранное из текстового файла src.
+
+    Если задан user_id, все записи относятся к этому пользователю (импорт из бота).
+    Существующие записи (user_id, recipe_id) обновляются.
+    Возвращает (импортировано, пропущено некорректных). Если файл не разбирается
+    до конца, записи до ошибки сохраняются и выбрасывается ImportParseError
+    с их числом.
+    """
+    imported = skipped = 0
+    batch = []
+
+    def flush():
+        """Записать пакет одной транзакцией; возвращает число записанных строк"""
+        conn.executemany('''
+            INSERT INTO favorite_recipes
+            (user_id, recipe_id, recipe_name, recipe_image, recipe_instructions, rating, added_date)
+            VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            ON CONFLICT(user_id, recipe_id) DO UPDATE SET
+                recipe_name = excluded.recipe_name,
+                recipe_image = excluded.recipe_image,
+                recipe_instructions = excluded.recipe_instructions,
+                rating = excluded.rating
+        ''', batch)
+        conn.commit()
+        count = len(batch)
+        batch.clear()
+        return count
+
+    try:
+        for record in _iter_records(src, fmt):
+            row = _to_row(record, user_id) if isinstance(record, dict) else None
+            if row is None:
+                skipped += 1
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                imported += flush()
+                if progress:
+                    progress(imported)
+    except (csv.Error, json.JSONDecodeError, UnicodeDecodeError) as e:
+        # Уже разобранные записи сохраняются даже при ошибке в середине файла
+        position = imported + skipped + len(batch) + 1
+        if batch:
+            imported += flush()
+        raise ImportParseError(f"не удалось разобрать запись {position}: {e}", imported, skipped) from e
+
+    if batch:
+        imported += flush()
+    if progress:
+        progress(imported)
+    return imported, skipped
+
+
+def default_db_path():
+    """Файл базы данных бота: DB_PATH из config.py, если он есть"""
+    try:
+        import config
+    except ImportError:
+        return 'recipes.db'
+    return getattr(config, 'DB_PATH', 'recipes.db')
+
+
+def main():
+    """Командная строка для экспорта/импорта всей таблицы"""
+    parser = argparse.ArgumentParser(description="Экспорт и импорт избранных рецептов")
+    parser.add_argument('action', choices=('export', 'import'))
+    parser.add_argument('path', help="Файл .csv или .jsonl")
+    parser.add_argument('--db', default=default_db_path(), help="Файл базы данных (по умолчанию DB_PATH из config.py)")
+    parser.add_argument('--user', type=int, help="Только один пользователь")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = detect_format(args.path)
+    conn = sqlite3.connect(args.db, timeout=30)
+    conn.execute('PRAGMA busy_timeout = 30000')
+
+    def progress(count):
+        print(f"\r{count} записей...", end='', file=sys.stderr, flush=True)
+
+    try:
+        if args.action == 'export':
+            with open(args.path, 'w', encoding='utf-8', newline='') as out:
+                count = export_favorites(conn, out, fmt, args.user, args.chunk_size, progress)
+            print(f"\n✅ Экспортировано записей: {count}", file=sys.stderr)
+        else:
+            if not os.path.exists(args.path):
+                parser.error(f"файл не найден: {args.path}")
+            with open(args.path, encoding='utf-8', newline='') as src:
+                imported, skipped = import_favorites(conn, src, fmt, args.user, args.chunk_size, progress)
+            print(f"\n✅ Импортировано записей: {imported}, пропущено: {skipped}", file=sys.stderr)
+    except ImportParseError as e:
+        print(f"\n❌ Ошибка: {e}", file=sys.stderr)
+        print(f"Импортировано записей до ошибки: {e.imported}, пропущено: {e.skipped}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
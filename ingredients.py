@@ -0,0 +1,133 @@
+"""Разбор ингредиентов рецепта TheMealDB в нормализованные строки.
+
+Поля strIngredientN/strMeasureN разбираются один раз в кортежи
+(позиция, ингредиент, количество, единица, исходная мера), которые хранятся
+в таблице recipe_ingredients. Вес приводится к граммам, объем в литрах - к
+миллилитрам; мера без числа («pinch», «to taste») хранится с количеством None.
+Счетные единицы («2 cloves», «1 head») сохраняются в единственном числе,
+чтобы такие строки не складывались со штуками; слова о размере и обработке
+(«3 large», «2 chopped») единицей не считаются.
+"""
+import re
+
+MAX_INGREDIENTS = 20
+
+# Единица -> (нормализованная единица, множитель)
+UNITS = {
+    'g': ('g', 1), 'gr': ('g', 1), 'gram': ('g', 1), 'grams': ('g', 1),
+    'kg': ('g', 1000), 'kilogram': ('g', 1000), 'kilograms': ('g', 1000),
+    'oz': ('g', 28.35), 'ounce': ('g', 28.35), 'ounces': ('g', 28.35),
+    'lb': ('g', 453.6), 'lbs': ('g', 453.6), 'pound': ('g', 453.6), 'pounds': ('g', 453.6),
+    'ml': ('ml', 1), 'millilitre': ('ml', 1), 'millilitres': ('ml', 1), 'milliliter': ('ml', 1), 'milliliters': ('ml', 1),
+    'l': ('ml', 1000), 'litre': ('ml', 1000), 'litres': ('ml', 1000), 'liter': ('ml', 1000), 'liters': ('ml', 1000),
+    'cup': ('cup', 1), 'cups': ('cup', 1),
+    'tbsp': ('tbsp', 1), 'tbs': ('tbsp', 1), 'tblsp': ('tbsp', 1), 'tablespoon': ('tbsp', 1), 'tablespoons': ('tbsp', 1),
+    'tsp': ('tsp', 1), 'teaspoon': ('tsp', 1), 'teaspoons': ('tsp', 1),
+}
+
+# Счетные единицы -> нормализованное название (формы, которые не сводит _singular)
+COUNT_UNITS = {
+    'clove': 'clove', 'head': 'head', 'can': 'can', 'tin': 'can', 'slice': 'slice',
+    'bunch': 'bunch', 'pinch': 'pinch', 'sprig': 'sprig', 'stalk': 'stalk', 'stick': 'stick',
+    'handful': 'handful', 'piece': 'piece', 'packet': 'packet', 'pack': 'packet', 'jar': 'jar',
+    'dash': 'dash', 'sheet': 'sheet', 'fillet': 'fillet', 'rasher': 'rasher', 'knob': 'knob',
+    'leave': 'leaf', 'leaf': 'leaf', 'drop': 'drop', 'cube': 'cube', 'bottle': 'bottle',
+}
+# Размер и обработка: пропускаются, единицей может быть следующее слово («2 large cloves»)
+DESCRIPTORS = {
+    'large', 'medium', 'small', 'big', 'little', 'whole', 'fresh', 'ripe', 'heaped', 'level',
+    'generous', 'chopped', 'sliced', 'diced', 'minced', 'grated', 'crushed', 'peeled',
+    'beaten', 'finely', 'roughly', 'thinly', 'dried', 'frozen', 'cooked', 'raw', 'boneless',
+    'skinless', 'free', 'range', 'extra', 'thick', 'thin', 'good', 'about',
+}
+
+_FRACTIONS = {'½': 0.5, '⅓': 1 / 3, '⅔': 2 / 3, '¼': 0.25, '¾': 0.75, '⅛': 0.125}
+# Количество: «1 1/2», «1/2», «1,000», «1.5», «2», «½», «1½»; затем необязательная единица
+_QUANTITY = re.compile(
+    r'^\s*(\d+\s+\d+/\d+|\d+/\d+|\d{1,3}(?:,\d{3})+(?![\d.,])|\d+(?:[.,]\d+)?\s*[½⅓⅔¼¾⅛]?|[½⅓⅔¼¾⅛])'
+)
+_THOUSANDS = re.compile(r'\d{1,3}(?:,\d{3})+')
+_MULTIPLIER = re.compile(r'^\s*[x×]\s*(?=[\d½⅓⅔¼¾⅛])', re.IGNORECASE)
+_UNIT = re.compile(r'^\s*-?\s*([a-zA-Z]+)\.?\b')
+
+
+def _to_number(text):
+    text = text.strip()
+    # «1,000» - разделитель тысяч, «1,5» - десятичная запятая
+    text = text.replace(',', '') if _THOUSANDS.fullmatch(text) else text.replace(',', '.')
+    if text[-1] in _FRACTIONS:
+        whole = text[:-1].strip()
+        return (float(whole) if whole else 0) + _FRACTIONS[text[-1]]
+    if ' ' in text:
+        whole, fraction = text.split()
+        return float(whole) + _to_number(fraction)
+    if '/' in text:
+        numerator, denominator = text.split('/')
+        return float(numerator) / float(denominator) if float(denominator) else 0
+    return float(text)
+
+
+def _singular(word):
+    """Грубое приведение английского слова к единственному числу: cloves -> clove"""
+    if word.endswith(('ches', 'shes', 'sses', 'xes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 2:
+        return word[:-1]
+    return word
+
+
+def parse_measure(measure):
+    """Мера («1 cup», «200g», «2 tbsp») -> (количество или None, единица)"""
+    measure = (measure or '').strip()
+    match = _QUANTITY.match(measure)
+    if not match:
+        return None, ''
+
+    quantity = _to_number(match.group(1))
+    rest = measure[match.end():]
+    # Диапазон «2-3»: берем нижнюю границу
+    rest = re.sub(r'^\s*-\s*\d+(?:[.,]\d+)?', '', rest)
+
+    # «2 x 400g» - две упаковки по 400 г
+    multiplier = _MULTIPLIER.match(rest)
+    if multiplier:
+        inner_quantity, inner_unit = parse_measure(rest[multiplier.end():])
+        if inner_quantity is not None:
+            return round(quantity * inner_quantity, 3), inner_unit
+
+    unit_match = _UNIT.match(rest)
+    while unit_match and unit_match.group(1).lower() in DESCRIPTORS:
+        rest = rest[unit_match.end():]
+        unit_match = _UNIT.match(rest)
+    if not unit_match:
+        return round(quantity, 3), ''
+    word = unit_match.group(1).lower()
+    if word in UNITS:
+        unit, factor = UNITS[word]
+        return round(quantity * factor, 3), unit
+    # Прочие слова сохраняются: «1 medium onion» для ингредиента «Onion» отбросит parse_ingredients
+    word = _singular(word)
+    return round(quantity, 3), COUNT_UNITS.get(word, word)
+
+
+def meal_ingredients(recipe):
+    """Пары (ингредиент, мера) из ответа API в исходном порядке"""
+    pairs = []
+    for i in range(1, MAX_INGREDIENTS + 1):
+        ingredient = recipe.get(f'strIngredient{i}')
+        if ingredient and ingredient.strip():
+            pairs.append((ingredient.strip(), (recipe.get(f'strMeasure{i}') or '').strip()))
+    return pairs
+
+
+def parse_ingredients(recipe):
+    """Строки для recipe_ingredients: (позиция, ингредиент, количество, единица, мера)"""
+    rows = []
+    for position, (ingredient, measure) in enumerate(meal_ingredients(recipe), start=1):
+        ingredient = ingredient.lower()
+        quantity, unit = parse_measure(measure)
+        # «3 eggs» для ингредиента «Eggs» - это штуки, а не единица «egg»
+        if unit and unit in {_singular(word) for word in ingredient.split()}:
+            unit = ''
+        rows.append((position, ingredient, quantity, unit, measure))
+    return rows
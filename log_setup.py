@@ -0,0 +1,88 @@
+"""Настройка логирования бота.
+
+Записи ставятся в очередь (QueueHandler) и форматируются/выводятся в фоновом
+потоке (QueueListener), поэтому ввод-вывод логов не задерживает цикл событий.
+LOG_FORMAT = 'json' включает структурированные записи в формате JSON.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+
+# Контекст текущего обновления (заполняется при обработке обновления)
+current_update = contextvars.ContextVar('current_update', default=None)
+
+# Стандартные атрибуты LogRecord; все остальные пришли через extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class UpdateContextFilter(logging.Filter):
+    """Добавляет к записи update_id и route текущего обновления"""
+
+    def filter(self, record):
+        context = current_update.get()
+        if context is not None:
+            record.update_id, record.route = context
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей уровня INFO и ниже, помеченных extra={'sampled': True}"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno > logging.INFO or not getattr(record, 'sampled', False):
+            return True
+        return random.random() < self.rate
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке: сообщение собирается в QueueListener"""
+
+    def prepare(self, record):
+        return copy.copy(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != 'sampled':
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(level, fmt, sample_rate=1.0):
+    """Направить логи через очередь в фоновый поток; возвращает запущенный QueueListener"""
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(fmt))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(UpdateContextFilter())
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(getattr(logging, level))
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,95 @@
+"""Снимок горячих данных бота для быстрого «теплого» старта.
+
+Формат файла (версия 1):
+    заголовок  - struct '<8sII': сигнатура, версия формата, длина оглавления
+    оглавление - JSON: {"meta": {...}, "sections": {секция: {ключ: [смещение, длина]}}}
+    данные     - значения в JSON (UTF-8), смещения отсчитываются от начала данных
+
+Файл открывается через mmap: при загрузке читается только оглавление,
+значения декодируются по запросу.
+"""
+import json
+import logging
+import mmap
+import struct
+
+MAGIC = b'RCPSNAP\0'
+VERSION = 1
+_HEADER = struct.Struct('<8sII')
+
+logger = logging.getLogger(__name__)
+
+
+def write_snapshot(path, sections, meta=None):
+    """Записать снимок. sections: {имя секции: {ключ: значение}}"""
+    index = {}
+    chunks = []
+    offset = 0
+    for name, items in sections.items():
+        section_index = index[name] = {}
+        for key, value in items.items():
+            data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            section_index[str(key)] = [offset, len(data)]
+            chunks.append(data)
+            offset += len(data)
+
+    header = json.dumps({'meta': meta or {}, 'sections': index}, separators=(',', ':')).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for chunk in chunks:
+            f.write(chunk)
+
+
+class Snapshot:
+    """Снимок, отображенный в память"""
+
+    def __init__(self, file, mm, index, data_start):
+        self._file = file
+        self._mm = mm
+        self._sections = index['sections']
+        self.meta = index['meta']
+        self._data_start = data_start
+
+    @classmethod
+    def open(cls, path):
+        """Открыть снимок; None, если файла нет или он неподходящей версии"""
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        try:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # пустой файл
+            file.close()
+            return None
+
+        try:
+            magic, version, header_length = _HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"неподдерживаемый формат (версия {version})")
+            header_end = _HEADER.size + header_length
+            index = json.loads(mm[_HEADER.size:header_end])
+            return cls(file, mm, index, header_end)
+        except (struct.error, ValueError, KeyError, TypeError) as e:
+            logger.warning("Снимок %s пропущен: %s", path, e)
+            mm.close()
+            file.close()
+            return None
+
+    def get(self, section, key, default=None):
+        """Значение по ключу (декодируется при обращении)"""
+        entry = self._sections.get(section, {}).get(str(key))
+        if entry is None:
+            return default
+        start = self._data_start + entry[0]
+        return json.loads(self._mm[start:start + entry[1]])
+
+    def drop_section(self, section):
+        """Не использовать секцию (например, если данные устарели)"""
+        self._sections.pop(section, None)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()